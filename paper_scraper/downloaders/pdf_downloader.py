@@ -1,32 +1,60 @@
 import logging
+import threading
+from pathlib import Path
 from time import sleep
+from typing import Optional
+from urllib.parse import urlparse
 
+import pymupdf
 import requests
-import pdfplumber
 
 logger = logging.getLogger(__name__)
 
-def download_pdf(pdf_url: str, filename: str) -> str:
+CHUNK_SIZE = 64 * 1024  # Bytes written per streamed chunk
+MAX_PDF_SIZE = 100 * 1024 * 1024  # Guard against runaway downloads
+
+# MuPDF is not thread-safe, so PyMuPDF calls from worker threads take turns
+_MUPDF_LOCK = threading.Lock()
+
+# Hosts that only serve PDFs after their landing page has set cookies
+COOKIE_REQUIRED_HOSTS = {
+    "www.sciencedirect.com",
+    "link.springer.com",
+    "onlinelibrary.wiley.com",
+}
+
+def download_pdf(pdf_url: str, filename: str, session: Optional[requests.Session] = None,
+                 max_size: int = MAX_PDF_SIZE) -> str:
     """
     Download a PDF from a given URL and save it to the specified filename.
+    The body is streamed to disk in chunks rather than held in memory.
+    Pass a shared session to reuse pooled connections across downloads.
     """
     logger.info(f"Downloading PDF from {pdf_url}")
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Accept": "application/pdf,*/*",
     }
-    session = requests.Session()
-    try:
-        base_url = '/'.join(pdf_url.split('/')[:3])
-        headers["Referer"] = base_url
-        session.get(base_url, headers=headers, timeout=10)
-    except Exception as e:
-        logger.warning(f"Failed to pre-load cookies: {e}")
+    session = session or requests.Session()
+    base_url = '/'.join(pdf_url.split('/')[:3])
+    headers["Referer"] = base_url
+    
+    # Only publishers that gate PDFs behind a session cookie need the extra round trip
+    if urlparse(pdf_url).netloc.lower() in COOKIE_REQUIRED_HOSTS:
+        try:
+            session.get(base_url, headers=headers, timeout=10)
+        except Exception as e:
+            logger.warning(f"Failed to pre-load cookies: {e}")
+
+    if not _probe_pdf(session, pdf_url, headers):
+        logger.warning(f"Probe indicates {pdf_url} does not serve a PDF")
+        raise ValueError("URL does not serve PDF content")
 
     max_retries = 3
     for attempt in range(max_retries):
         try:
-            response = session.get(pdf_url, headers=headers, allow_redirects=True, timeout=30)
+            response = session.get(pdf_url, headers=headers, allow_redirects=True,
+                                   timeout=30, stream=True)
             response.raise_for_status()
             break
         except requests.exceptions.RequestException as e:
@@ -37,31 +65,82 @@ def download_pdf(pdf_url: str, filename: str) -> str:
             else:
                 raise
     
-    content_type = response.headers.get('Content-Type', '').lower()
-    if 'pdf' not in content_type:
-        logger.warning(f"Received non-PDF content ({content_type}) from {pdf_url}")
-        raise ValueError(f"Expected PDF content but received {content_type}")
-    
-    if not response.content.startswith(b'%PDF-'):
-        logger.warning(f"Content from {pdf_url} does not appear to be a valid PDF")
-        raise ValueError("Downloaded content is not a valid PDF file")
+    with response:
+        content_type = response.headers.get('Content-Type', '').lower()
+        if 'pdf' not in content_type:
+            logger.warning(f"Received non-PDF content ({content_type}) from {pdf_url}")
+            raise ValueError(f"Expected PDF content but received {content_type}")
+        
+        content_length = int(response.headers.get('Content-Length') or 0)
+        if content_length > max_size:
+            raise ValueError(f"PDF size {content_length} bytes exceeds limit of {max_size} bytes")
+        
+        # Validate the magic number before anything is written to disk
+        chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+        first_chunk = next(chunks, b'')
+        if not first_chunk.startswith(b'%PDF-'):
+            logger.warning(f"Content from {pdf_url} does not appear to be a valid PDF")
+            raise ValueError("Downloaded content is not a valid PDF file")
+        
+        try:
+            with open(filename, "wb") as f:
+                f.write(first_chunk)
+                size = len(first_chunk)
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > max_size:
+                        raise ValueError(f"PDF exceeds size limit of {max_size} bytes")
+                    f.write(chunk)
+        except BaseException:
+            # Don't leave a truncated PDF behind
+            Path(filename).unlink(missing_ok=True)
+            raise
     
-    with open(filename, "wb") as f:
-        f.write(response.content)
     logger.info(f"PDF saved to {filename}")
     return filename
 
+def _probe_pdf(session: requests.Session, pdf_url: str, headers: dict) -> bool:
+    """
+    Cheaply check whether a URL serves a PDF before transferring the body.
+    Trusts the HEAD Content-Type when given, otherwise inspects the first KiB
+    via a Range request. Inconclusive probes defer to the full download.
+    """
+    try:
+        head = session.head(pdf_url, headers=headers, allow_redirects=True, timeout=10)
+        content_type = head.headers.get('Content-Type', '').lower()
+        if head.ok and content_type:
+            return 'pdf' in content_type
+        
+        # Server doesn't answer HEAD usefully, peek at the signature instead
+        range_headers = {**headers, "Range": "bytes=0-1023"}
+        with session.get(pdf_url, headers=range_headers, allow_redirects=True,
+                         timeout=10, stream=True) as probe:
+            if not probe.ok:
+                return True
+            return next(probe.iter_content(chunk_size=1024), b'').startswith(b'%PDF-')
+    except requests.exceptions.RequestException as e:
+        logger.debug("PDF probe failed for %s: %s", pdf_url, e)
+        return True
+
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
-    Extract text from a PDF file using pdfplumber.
+    Extract text from a PDF file using PyMuPDF.
+    Safe to call from several threads, e.g. right after each download on the
+    download threads; the extraction itself runs one PDF at a time.
     """
     logger.info(f"Extracting text from {pdf_path}")
     text = ""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = "\n".join(page.extract_text() for page in pdf.pages if page.extract_text())
+        texts = []
+        with _MUPDF_LOCK, pymupdf.open(pdf_path) as doc:
+            for page in doc:
+                # Extract each page once and skip pages without a text layer
+                page_text = page.get_text("text")
+                if page_text:
+                    texts.append(page_text)
+        text = "\n".join(texts)
     except Exception as e:
         logger.error(f"Failed to extract text from PDF: {e}")
         return ""
     logger.info(f"Successfully extracted text from {pdf_path}")
-    return text
\ No newline at end of file
+    return text
@@ -2,11 +2,14 @@
 
 import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 from pathlib import Path
 
 from paper_scraper.scraper import PaperScraper
+from paper_scraper.utils.filenames import pdf_filename
 from paper_scraper.utils.logging_config import setup_logging
+from paper_scraper.utils.rate_limiter import RateLimiter
 
 # Configure logging
 logger = setup_logging()
@@ -26,41 +29,68 @@ def main():
                         help='Sort order (default: relevance)')
     parser.add_argument('--download-pdfs', '-p', action='store_true',
                         help='Download PDFs when available')
+    parser.add_argument('--workers', '-w', type=int, default=8,
+                        help='Number of concurrent PDF downloads (default: 8)')
     args = parser.parse_args()
     
     # Initialize scraper and create folders
     scraper = PaperScraper(output_dir=args.output_dir, rate_limit=args.rate_limit)
     metadata_path, pdf_path = scraper.create_query_folder('pubmed', args.query)
     
+    rate_limiter = RateLimiter(args.rate_limit)
+    
+    def download(paper: dict) -> None:
+        pdf_file = pdf_path / pdf_filename(paper)
+        rate_limiter.wait()
+        scraper.download_pdf(paper['full_text_link'], str(pdf_file))
+    
     valid_papers = []
     total_attempts = 0
     max_attempts = args.max_results * 5 
+    offset = 0
+    seen_pmids = set()
     
-    while len(valid_papers) < args.max_results and total_attempts < max_attempts:
-        batch_size = min(100, args.max_results * 2)
-        pmids = scraper.search_pubmed(args.query, batch_size, args.date_range, args.sort)
-        results = scraper.fetch_pubmed_details(pmids)
-        
-        for paper in results:
-            if len(valid_papers) >= args.max_results:
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        while len(valid_papers) < args.max_results and total_attempts < max_attempts:
+            # Page through the search results instead of re-requesting the first batch
+            batch_size = min(100, args.max_results * 2)
+            pmids = scraper.search_pubmed(args.query, batch_size, args.date_range, args.sort,
+                                          retstart=offset)
+            if not pmids:
+                logger.info("No more search results available")
                 break
-                    
-            if pdf_url := paper.get('full_text_link'):
-                try:
-                    title = paper.get('title', '')
-                    safe_title = ''.join(c.lower() for c in title if c.isalnum() or c.isspace())
-                    safe_title = safe_title.replace(' ', '_')[:100]  # Truncate to reasonable length
-                    
-                    # Fall back to PMID if title processing results in empty string
-                    filename = f"{safe_title or paper['pubmed_id']}.pdf"
-                    pdf_file = pdf_path / filename
-                    
-                    scraper.download_pdf(pdf_url, str(pdf_file))
-                    valid_papers.append(paper)
-                    logger.info(f"Successfully downloaded PDF {len(valid_papers)}/{args.max_results}")
-                except Exception as e:
-                    logger.warning(f"Failed to download PDF for PMID {paper['pubmed_id']}: {e}")
-            total_attempts += 1
+            offset += len(pmids)
+            
+            new_pmids = [pmid for pmid in pmids if pmid not in seen_pmids]
+            if not new_pmids:
+                continue
+            seen_pmids.update(new_pmids)
+            results = scraper.fetch_pubmed_details(new_pmids, history=scraper.search_history)
+            total_attempts += len(results)
+            
+            candidates = (paper for paper in results if paper.get('full_text_link'))
+            pending = {}
+            while True:
+                # Only keep as many downloads in flight as are still needed
+                while (len(pending) < args.workers
+                       and len(valid_papers) + len(pending) < args.max_results):
+                    paper = next(candidates, None)
+                    if paper is None:
+                        break
+                    pending[executor.submit(download, paper)] = paper
+                
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    paper = pending.pop(future)
+                    try:
+                        future.result()
+                        valid_papers.append(paper)
+                        logger.info(f"Successfully downloaded PDF {len(valid_papers)}/{args.max_results}")
+                    except Exception as e:
+                        logger.warning(f"Failed to download PDF for PMID {paper['pubmed_id']}: {e}")
             
     # Save metadata of the successfully processed papers
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
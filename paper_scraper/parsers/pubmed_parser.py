@@ -1,271 +1,368 @@
 import logging
-from typing import List, Dict, Optional
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
 
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
 
 logger = logging.getLogger(__name__)
 
+# Elements collected by scan_article, keyed by tag (first occurrence wins)
+_SCAN_TAGS = (
+    "MedlineCitation", "PMID", "Article", "ArticleTitle", "Abstract", "AuthorList",
+    "Journal", "ArticleIdList", "PubDate", "DateCompleted", "DateRevised",
+)
+
+# --- Compiled XPath expressions ---
+# Compiled once at import and evaluated relative to the scanned sub-elements.
+
+_XP_DOI = etree.XPath("ArticleId[@IdType='doi']/text()")
+_XP_ABSTRACT_SECTIONS = etree.XPath("AbstractText")
+_XP_AUTHORS = etree.XPath("Author")
+_XP_COLLECTIVE_NAME = etree.XPath("(.//CollectiveName)[1]")
+_XP_LASTNAME = etree.XPath("string((.//LastName)[1])")
+_XP_FIRSTNAME = etree.XPath("string((.//ForeName)[1])")
+_XP_AFFILIATION = etree.XPath("string((.//Affiliation)[1])")
+_XP_JOURNAL_TITLE = etree.XPath("(.//Title)[1]")
+_XP_JOURNAL_ISO = etree.XPath("string((.//ISOAbbreviation)[1])")
+_XP_ISSN = etree.XPath("string((.//ISSN)[1])")
+_XP_VOLUME = etree.XPath("string((.//Volume)[1])")
+_XP_ISSUE = etree.XPath("string((.//Issue)[1])")
+_XP_MEDLINE_DATE = etree.XPath("(.//MedlineDate)[1]")
+_XP_YEAR = etree.XPath("(.//Year)[1]")
+_XP_MONTH = etree.XPath("(.//Month)[1]")
+_XP_DAY = etree.XPath("(.//Day)[1]")
+_XP_ARTICLE_IDS = etree.XPath("ArticleId")
+_XP_OTHER_IDS = etree.XPath("OtherID")
+_XP_PMC_ARTICLE_ID = etree.XPath("ArticleId[@IdType='pmc']/text()")
+_XP_PMC_OTHER_ID = etree.XPath("OtherID[@Source='PMC']/text()")
+_XP_ARTICLE_LINKS = etree.XPath(".//ELocationID | .//Link")
+
+# Common PDF-related text in link hrefs, classes and ids
+_PDF_LINK_PATTERNS = ("pdf", "full-text", "fulltext", "download", "article", "view", "access")
+# Substrings marking a direct full text URL in the Article element
+_FULL_TEXT_URL_PATTERNS = (".pdf", "fulltext")
+
+def _compile_patterns(patterns: Tuple[str, ...]) -> re.Pattern:
+    """Compile literal substrings into one case-insensitive matcher scanned in a single pass."""
+    return re.compile("|".join(map(re.escape, patterns)), re.IGNORECASE)
+
+_PDF_LINK_RE = _compile_patterns(_PDF_LINK_PATTERNS)
+_FULL_TEXT_URL_RE = _compile_patterns(_FULL_TEXT_URL_PATTERNS)
+
+# DOI registrant prefixes of publishers with known PDF routes
+PUBLISHER_PREFIXES = {
+    "10.1016": "Elsevier",
+    "10.1038": "Nature",
+    "10.1093": "Oxford",
+    "10.1007": "Springer",
+    "10.1111": "Wiley",
+    "10.1371": "PLOS",
+}
+_PUBLISHER_RE = re.compile(
+    r"^(?P<prefix>" + "|".join(map(re.escape, PUBLISHER_PREFIXES)) + r")/"
+)
+
+# Successful DOI -> PDF resolutions, keyed by (doi, unpaywall_email), least recently used first
+_DOI_PDF_CACHE_SIZE = 4096
+_doi_pdf_cache: "OrderedDict[Tuple[str, Optional[str]], str]" = OrderedDict()
+_doi_pdf_cache_lock = threading.Lock()
+
+ScannedArticle = Dict[str, etree._Element]
+
+def _text(element: Optional[etree._Element]) -> str:
+    """Get the stripped text content of an element, including nested markup."""
+    if element is None:
+        return ""
+    return "".join(element.itertext()).strip()
+
+def _first(results: List[etree._Element]) -> Optional[etree._Element]:
+    """Get the first node of an XPath node-set result."""
+    return results[0] if results else None
+
 # --- PubMed XML Parsing Functions ---
 
-def get_doi(soup: BeautifulSoup) -> Optional[str]:
+def scan_article(article: etree._Element) -> ScannedArticle:
+    """
+    Collect the sub-elements needed by the get_* helpers in a single tree walk.
+    Pass the result to the helpers instead of the raw PubmedArticle element.
+    """
+    scanned = {}
+    for element in article.iter(*_SCAN_TAGS):
+        scanned.setdefault(element.tag, element)
+    return scanned
+
+def get_pmid(scanned: ScannedArticle) -> str:
+    """Get PubMed ID from article."""
+    return _text(scanned.get("PMID"))
+
+def get_doi(scanned: ScannedArticle) -> Optional[str]:
     """Get DOI from article."""
-    article_ids = soup.find("ArticleIdList") or soup.find("PubmedData")
-    if article_ids:
-        doi_tag = article_ids.find("ArticleId", {"IdType": "doi"})
-        if doi_tag:
-            return doi_tag.text.strip()
-    return None
+    article_ids = scanned.get("ArticleIdList")
+    if article_ids is None:
+        return None
+    doi = _XP_DOI(article_ids)
+    return doi[0].strip() if doi else None
 
-def get_title(soup: BeautifulSoup) -> str:
+def get_title(scanned: ScannedArticle) -> str:
     """Get article title."""
-    title_tag = soup.find("ArticleTitle")
-    return title_tag.text.strip() if title_tag else ""
+    return _text(scanned.get("ArticleTitle"))
 
-def get_abstract(soup: BeautifulSoup) -> str:
+def get_abstract(scanned: ScannedArticle) -> str:
     """Get article abstract."""
-    abstract = soup.find("Abstract")
-    if not abstract:
+    abstract = scanned.get("Abstract")
+    if abstract is None:
         return ""
     
-    sections = abstract.find_all("AbstractText")
+    sections = _XP_ABSTRACT_SECTIONS(abstract)
     if not sections:
         return ""
     
     # Handle structured abstracts
     if any(section.get("Label") for section in sections):
         return "\n".join(
-            f"{section.get('Label', 'Abstract')}: {section.text.strip()}"
+            f"{section.get('Label', 'Abstract')}: {_text(section)}"
             for section in sections
         )
     
     # Handle simple abstracts
-    return " ".join(section.text.strip() for section in sections)
+    return " ".join(_text(section) for section in sections)
 
-def get_authors(soup: BeautifulSoup) -> List[Dict]:
+def get_authors(scanned: ScannedArticle) -> List[Dict]:
     """Get article authors."""
-    author_list = soup.find("AuthorList")
-    if not author_list:
+    author_list = scanned.get("AuthorList")
+    if author_list is None:
         return []
     
     authors = []
-    for author in author_list.find_all("Author"):
-        if author.find("CollectiveName"):
+    for author in _XP_AUTHORS(author_list):
+        collective_name = _first(_XP_COLLECTIVE_NAME(author))
+        if collective_name is not None:
             authors.append({
-                "collective_name": author.find("CollectiveName").text.strip(),
+                "collective_name": _text(collective_name),
                 "lastname": "",
                 "firstname": "",
                 "affiliation": ""
             })
         else:
-            lastname = author.find("LastName")
-            firstname = author.find("ForeName")
-            affiliation = author.find("Affiliation")
-            
             authors.append({
-                "lastname": lastname.text.strip() if lastname else "",
-                "firstname": firstname.text.strip() if firstname else "",
-                "affiliation": affiliation.text.strip() if affiliation else ""
+                "lastname": _XP_LASTNAME(author).strip(),
+                "firstname": _XP_FIRSTNAME(author).strip(),
+                "affiliation": _XP_AFFILIATION(author).strip()
             })
     
     return authors
 
-def get_journal_info(soup: BeautifulSoup) -> Dict:
+def get_journal_info(scanned: ScannedArticle) -> Dict:
     """Get journal information."""
-    journal = soup.find("Journal")
-    if not journal:
+    journal = scanned.get("Journal")
+    if journal is None:
         return {}
     
+    title = _first(_XP_JOURNAL_TITLE(journal))
     return {
-        "name": (journal.find("Title").text.strip() if journal.find("Title") 
-                else journal.find("ISOAbbreviation").text.strip() if journal.find("ISOAbbreviation")
-                else ""),
-        "issn": journal.find("ISSN").text.strip() if journal.find("ISSN") else "",
-        "volume": journal.find("Volume").text.strip() if journal.find("Volume") else "",
-        "issue": journal.find("Issue").text.strip() if journal.find("Issue") else "",
+        "name": _text(title) if title is not None else _XP_JOURNAL_ISO(journal).strip(),
+        "issn": _XP_ISSN(journal).strip(),
+        "volume": _XP_VOLUME(journal).strip(),
+        "issue": _XP_ISSUE(journal).strip(),
     }
 
-def get_pub_date(soup: BeautifulSoup) -> Optional[str]:
+def get_pub_date(scanned: ScannedArticle) -> Optional[str]:
     """Get publication date."""
-    pub_date = (
-        soup.find("PubDate") or 
-        soup.find("DateCompleted") or 
-        soup.find("DateRevised")
-    )
+    pub_date = None
+    for tag in ("PubDate", "DateCompleted", "DateRevised"):
+        pub_date = scanned.get(tag)
+        if pub_date is not None:
+            break
     
-    if not pub_date:
+    if pub_date is None:
         return None
     
-    if pub_date.find("MedlineDate"):
-        return pub_date.find("MedlineDate").text.strip()
+    medline_date = _first(_XP_MEDLINE_DATE(pub_date))
+    if medline_date is not None:
+        return _text(medline_date)
     
-    year = pub_date.find("Year")
-    month = pub_date.find("Month")
-    day = pub_date.find("Day")
+    year = _first(_XP_YEAR(pub_date))
+    month = _first(_XP_MONTH(pub_date))
+    day = _first(_XP_DAY(pub_date))
     
-    if year:
-        date_parts = [year.text.strip()]
-        if month:
-            date_parts.append(month.text.strip().zfill(2))
-            if day:
-                date_parts.append(day.text.strip().zfill(2))
+    if year is not None:
+        date_parts = [_text(year)]
+        if month is not None:
+            date_parts.append(_text(month).zfill(2))
+            if day is not None:
+                date_parts.append(_text(day).zfill(2))
         return "-".join(date_parts)
     
     return None
 
-def get_full_text_link(soup: BeautifulSoup, unpaywall_email: Optional[str] = None) -> Optional[str]:
+def _get_ids(scanned: ScannedArticle) -> List[etree._Element]:
+    """Get the article's own ArticleId and OtherID elements."""
+    ids = []
+    if (article_ids := scanned.get("ArticleIdList")) is not None:
+        ids.extend(_XP_ARTICLE_IDS(article_ids))
+    if (citation := scanned.get("MedlineCitation")) is not None:
+        ids.extend(_XP_OTHER_IDS(citation))
+    return ids
+
+def _get_pmc_id(scanned: ScannedArticle) -> Optional[str]:
+    """Get the article's PMC ID from its ArticleIdList or OtherID elements."""
+    for tag, xp in (("ArticleIdList", _XP_PMC_ARTICLE_ID), ("MedlineCitation", _XP_PMC_OTHER_ID)):
+        element = scanned.get(tag)
+        if element is not None and (pmc_ids := xp(element)):
+            return pmc_ids[0].strip().replace("PMC", "")
+    return None
+
+def get_full_text_link(scanned: ScannedArticle, unpaywall_email: Optional[str] = None,
+                       session: Optional[requests.Session] = None) -> Optional[str]:
     """
     Try to obtain a full text PDF link.
     First, check for a PMC link; if none, attempt to resolve via DOI.
     """
-    pmid = soup.find("Id").text if soup.find("Id") else "Unknown"
-    logger.debug(f"Attempting to get full text link for PMID {pmid}")
-    
-    # Log all available IDs for debugging
-    for id_tag in soup.find_all(["ArticleId", "OtherID"]):
-        logger.debug(f"Found ID: {id_tag.get('IdType')} = {id_tag.text}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Attempting to get full text link for PMID {get_pmid(scanned) or 'Unknown'}")
+        
+        # Log all available IDs for debugging
+        for id_tag in _get_ids(scanned):
+            logger.debug(f"Found ID: {id_tag.get('IdType')} = {_text(id_tag)}")
 
     # Check for PMC ID in multiple locations
-    pmc_id = None
-    for id_tag in soup.find_all(["ArticleId", "OtherID"]):
-        if id_tag.get("IdType") == "pmc" or id_tag.get("Source") == "PMC":
-            pmc_id = id_tag.text.strip().replace("PMC", "")
-            logger.debug(f"Found PMC ID: {pmc_id}")
-            break
-
+    pmc_id = _get_pmc_id(scanned)
     if pmc_id:
+        logger.debug("Found PMC ID: %s", pmc_id)
         pdf_url = f"https://www.ncbi.nlm.nih.gov/pmc/articles/PMC{pmc_id}/pdf"
-        logger.debug(f"Generated PMC PDF URL: {pdf_url}")
+        logger.debug("Generated PMC PDF URL: %s", pdf_url)
         return pdf_url
 
     # Try DOI resolution
-    doi = get_doi(soup)
+    doi = get_doi(scanned)
     if doi:
-        logger.debug(f"Found DOI: {doi}")
-        pdf_url = resolve_doi_to_pdf(doi, unpaywall_email)
+        logger.debug("Found DOI: %s", doi)
+        pdf_url = resolve_doi_to_pdf(doi, unpaywall_email, session)
         if pdf_url:
-            logger.debug(f"Resolved DOI to PDF: {pdf_url}")
+            logger.debug("Resolved DOI to PDF: %s", pdf_url)
             return pdf_url
         else:
             logger.debug("Failed to resolve DOI to PDF")
 
     # Try looking for direct links in the Article element
-    article = soup.find("Article")
-    if article:
+    article_element = scanned.get("Article")
+    if article_element is not None:
         logger.debug("Searching for links in Article element")
-        for link in article.find_all(["ELocationID", "Link"]):
-            url = link.get("URL", "") or link.text.strip()
-            logger.debug(f"Found link: {url}")
-            if url and (".pdf" in url.lower() or "fulltext" in url.lower()):
+        for link in _XP_ARTICLE_LINKS(article_element):
+            url = link.get("URL", "") or _text(link)
+            logger.debug("Found link: %s", url)
+            if url and _FULL_TEXT_URL_RE.search(url):
                 return url
 
     logger.debug("No full text link found through any method")
     return None
 
-def resolve_doi_to_pdf(doi: str, unpaywall_email: Optional[str] = None) -> Optional[str]:
+def resolve_doi_to_pdf(doi: str, unpaywall_email: Optional[str] = None,
+                       session: Optional[requests.Session] = None) -> Optional[str]:
     """
-    Resolve a DOI to a direct PDF link via multiple services
+    Resolve a DOI to a direct PDF link via multiple services.
+    Resolved links are memoized so repeated DOIs don't trigger further network
+    calls. Failures are not cached, as they may be transient (timeouts, 5xx).
     """
     if not doi:
         return None
     
-    logger.debug(f"Attempting to resolve DOI: {doi}")
+    key = (doi, unpaywall_email)
+    with _doi_pdf_cache_lock:
+        pdf_url = _doi_pdf_cache.get(key)
+        if pdf_url is not None:
+            _doi_pdf_cache.move_to_end(key)
+            return pdf_url
     
-    # Check if DOI is from a known publisher
-    publisher_patterns = {
-        "10.1016": "Elsevier",
-        "10.1038": "Nature",
-        "10.1093": "Oxford",
-        "10.1007": "Springer",
-        "10.1111": "Wiley",
-        "10.1371": "PLOS",
-    }
+    pdf_url = _resolve_doi_to_pdf(doi, unpaywall_email, session)
+    if pdf_url is not None:
+        with _doi_pdf_cache_lock:
+            _doi_pdf_cache[key] = pdf_url
+            _doi_pdf_cache.move_to_end(key)
+            if len(_doi_pdf_cache) > _DOI_PDF_CACHE_SIZE:
+                _doi_pdf_cache.popitem(last=False)
+    return pdf_url
+
+def _resolve_doi_to_pdf(doi: str, unpaywall_email: Optional[str],
+                        session: Optional[requests.Session]) -> Optional[str]:
+    """
+    Uncached DOI resolution behind resolve_doi_to_pdf.
+    """
+    http = session or requests
     
-    for pattern, publisher in publisher_patterns.items():
-        if pattern in doi:
-            logger.debug(f"Identified publisher: {publisher}")
-            break
+    logger.debug("Attempting to resolve DOI: %s", doi)
+    
+    # Check if DOI is from a known publisher
+    match = _PUBLISHER_RE.match(doi)
+    prefix = match.group("prefix") if match else None
+    if prefix:
+        logger.debug("Identified publisher: %s", PUBLISHER_PREFIXES[prefix])
         
     # Try direct publisher PDF links first
-    if "10.1016" in doi:  # Elsevier
+    if prefix == "10.1016":  # Elsevier
         pdf_url = f"https://www.sciencedirect.com/science/article/pii/{doi.split('/')[-1]}/pdfft"
-        logger.debug(f"Trying Elsevier direct PDF: {pdf_url}")
+        logger.debug("Trying Elsevier direct PDF: %s", pdf_url)
         try:
-            response = requests.head(pdf_url, allow_redirects=True, timeout=10)
+            response = http.head(pdf_url, allow_redirects=True, timeout=10)
             if response.ok and "pdf" in response.headers.get("Content-Type", "").lower():
                 return pdf_url
         except Exception as e:
-            logger.debug(f"Elsevier PDF attempt failed: {e}")
+            logger.debug("Elsevier PDF attempt failed: %s", e)
 
     # Try Unpaywall
     if unpaywall_email:
         logger.debug("Trying Unpaywall API")
         unpaywall_url = f"https://api.unpaywall.org/v2/{doi}?email={unpaywall_email}"
         try:
-            response = requests.get(unpaywall_url, timeout=10)
+            response = http.get(unpaywall_url, timeout=10)
             if response.ok:
                 data = response.json()
-                logger.debug(f"Unpaywall response: {data.get('best_oa_location')}")
+                logger.debug("Unpaywall response: %s", data.get("best_oa_location"))
                 best_location = data.get("best_oa_location", {})
                 if best_location:
                     pdf_url = best_location.get("pdf_url") or best_location.get("url")
                     if pdf_url and (pdf_url.endswith(".pdf") or "pdf" in pdf_url.lower()):
                         return pdf_url
         except Exception as e:
-            logger.debug(f"Unpaywall API error: {e}")
+            logger.debug("Unpaywall API error: %s", e)
 
     # Try DOI resolution
     try:
         logger.debug("Trying DOI resolution")
         headers = {"Accept": "text/html,application/pdf"}
-        response = requests.get(f"https://doi.org/{doi}", headers=headers, allow_redirects=True)
+        response = http.get(f"https://doi.org/{doi}", headers=headers, allow_redirects=True)
         if response.ok:
             final_url = response.url
-            logger.debug(f"DOI resolves to: {final_url}")
+            logger.debug("DOI resolves to: %s", final_url)
             if final_url.endswith(".pdf"):
                 return final_url
     except Exception as e:
-        logger.debug(f"DOI resolution failed: {e}")
+        logger.debug("DOI resolution failed: %s", e)
 
     return None
 
-def extract_pdf_from_html(html: str, base_url: str) -> Optional[str]:
+def extract_pdf_from_html(html: str, base_url: str,
+                          session: Optional[requests.Session] = None) -> Optional[str]:
     """
     Attempt to extract a PDF link from HTML content.
     Returns the first valid PDF URL found or None if no PDF link is found.
     """
-    soup = BeautifulSoup(html, 'html.parser')
+    http = session or requests
+    soup = BeautifulSoup(html, 'lxml')
     
-    # Expanded patterns for PDF link detection
-    pdf_patterns = [
-        # Common PDF-related text in links
-        lambda x: x and any(pattern in x.lower() for pattern in [
-            '.pdf', 
-            'pdf',
-            'full-text',
-            'fulltext',
-            'download',
-            'article',
-            'view',
-            'access'
-        ]),
-        # Common PDF-related classes/IDs
-        lambda x: x and any(pattern in x.lower() for pattern in [
-            'pdf-link',
-            'download-pdf',
-            'article-pdf',
-            'full-text-pdf'
-        ])
-    ]
-    
-    # Find links matching our patterns
+    # Find links whose href, class or id look PDF-related in a single pass
     pdf_links = []
-    for pattern in pdf_patterns:
-        pdf_links.extend(soup.find_all('a', href=pattern))
-        pdf_links.extend(soup.find_all('a', class_=pattern))
-        pdf_links.extend(soup.find_all('a', id=pattern))
+    for link in soup.find_all('a', href=True):
+        attributes = ' '.join([link['href'], ' '.join(link.get('class', [])), link.get('id', '')])
+        if _PDF_LINK_RE.search(attributes):
+            pdf_links.append(link)
     
     # Check each potential PDF link
+    checked_urls = set()
     for link in pdf_links:
         href = link.get('href', '')
         if not href:
@@ -273,10 +370,13 @@ def extract_pdf_from_html(html: str, base_url: str) -> Optional[str]:
             
         # Clean and normalize the URL
         pdf_url = requests.compat.urljoin(base_url, href.strip())
+        if pdf_url in checked_urls:
+            continue
+        checked_urls.add(pdf_url)
         
         try:
             # Use a timeout to avoid hanging
-            head = requests.head(pdf_url, 
+            head = http.head(pdf_url, 
                               allow_redirects=True, 
                               timeout=10,
                               headers={'User-Agent': 'Mozilla/5.0'})
@@ -292,7 +392,7 @@ def extract_pdf_from_html(html: str, base_url: str) -> Optional[str]:
                 return pdf_url
                 
         except Exception as e:
-            logger.debug(f"Failed to verify PDF URL {pdf_url}: {str(e)}")
+            logger.debug("Failed to verify PDF URL %s: %s", pdf_url, e)
             continue
             
     logger.debug("No valid PDF links found in HTML content")
@@ -1,34 +1,78 @@
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
-from time import sleep
+from typing import List, Dict, NamedTuple, Optional, Set, Tuple
 
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
 
 from paper_scraper.parsers.pubmed_parser import (
-    get_doi, get_title, get_abstract, get_authors,
+    scan_article, get_pmid, get_doi, get_title, get_abstract, get_authors,
     get_journal_info, get_pub_date, get_full_text_link
 )
-from paper_scraper.downloaders.pdf_downloader import download_pdf, extract_text_from_pdf
+from paper_scraper.downloaders.pdf_downloader import (
+    download_pdf, extract_text_from_pdf
+)
+from paper_scraper.utils.rate_limiter import RateLimiter
 
 logger = logging.getLogger(__name__)
 
+EUTILS_CACHE_EXPIRY = 24 * 60 * 60  # Seconds before cached E-utilities responses are refetched
+EUTILS_MIN_INTERVAL = 1 / 3  # NCBI allows 3 requests/s without an API key
+
+class SearchHistory(NamedTuple):
+    """
+    NCBI history server handle for one page of esearch results.
+    """
+    webenv: str
+    query_key: str
+    count: int     # Total number of hits for the query
+    retstart: int  # Offset of this page within the hits
+    retmax: int    # Number of IDs returned for this page
+
 class PaperScraper:
     """
     Class for searching and retrieving scientific literature from PubMed.
     Features:
       - Metadata retrieval and PDF downloading (when available)
       - Rate limiting for API calls
+      - Concurrent metadata retrieval
+      - On-disk caching of E-utilities responses
     """
-    def __init__(self, output_dir: str = "scrape_output", rate_limit: float = 0.1):
+    def __init__(self, output_dir: str = "scrape_output", rate_limit: float = 0.1,
+                 max_concurrency: int = 3):
         self.output_dir = output_dir
         self.rate_limit = rate_limit # Time between requests in seconds
+        self.max_concurrency = max_concurrency # Maximum efetch requests in flight
+        # Shared across worker threads so E-utilities calls stay within NCBI's rate limit
+        self.eutils_rate_limiter = RateLimiter(max(rate_limit, EUTILS_MIN_INTERVAL))
+        self.search_history: Optional[SearchHistory] = None # History handle of the last search
         self.unpaywall_email = os.getenv("UNPAYWALL_EMAIL")
         self.core_api_key = os.getenv("CORE_API_KEY")
+        
+        # Shared session so repeat hosts (eutils, doi.org, pmc) reuse pooled connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=20,
+                              max_retries=Retry(total=3, backoff_factor=1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         os.makedirs(output_dir, exist_ok=True)
         
+        # E-utilities responses are cached on disk so repeated queries skip the network
+        self.eutils_session = CachedSession(
+            os.path.join(output_dir, ".eutils_cache"),
+            backend="sqlite",
+            expire_after=EUTILS_CACHE_EXPIRY,
+            allowable_methods=("GET", "POST"),
+        )
+        self.eutils_session.mount("http://", adapter)
+        self.eutils_session.mount("https://", adapter)
+        
     def create_query_folder(self, database: str, query: str) -> tuple[Path, Path]:
         """
         Create folder structure for a specific query under the given database.
@@ -44,9 +88,11 @@ class PaperScraper:
     
     def search_pubmed(self, query: str, max_results: int = 100,
                       date_range: Optional[Tuple[str, str]] = None,
-                      sort: str = "relevance") -> List[str]:
+                      sort: str = "relevance", retstart: int = 0) -> List[str]:
         """
         Search PubMed for the given query and return a list of PubMed IDs.
+        Use retstart to page through results beyond the first batch.
+        The search is kept on NCBI's history server, see self.search_history.
         """
         logger.info(f"Searching PubMed for : {query}")
         base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
@@ -61,20 +107,34 @@ class PaperScraper:
             "db": "pubmed",
             "term": query,
             "retmax": min(max_results * 2, 100000), # Respect PubMed's max limit
+            "retstart": retstart,
             "retmode": "json",
             "sort": "relevance" if sort == "relevance" else "pub+date",
+            "usehistory": "y",
             # "api_key": os.getenv("NCBI_API_KEY", ""), 
         }
         
         try:
-            response = requests.get(base_url, params=params, timeout=30)
+            self.eutils_rate_limiter.wait()
+            response = self.eutils_session.get(base_url, params=params, timeout=30)
             response.raise_for_status()
             data = response.json()
             
             if "error" in data:
                 raise RuntimeError(f"PubMed API error: {data['error']}")
                 
-            id_list = data.get("esearchresult", {}).get("idlist", [])
+            result = data.get("esearchresult", {})
+            id_list = result.get("idlist", [])
+            self.search_history = None
+            if result.get("webenv") and result.get("querykey"):
+                self.search_history = SearchHistory(
+                    webenv=result["webenv"],
+                    query_key=result["querykey"],
+                    count=int(result.get("count", 0)),
+                    retstart=retstart,
+                    retmax=len(id_list)
+                )
+            
             if not id_list:
                 logger.warning("No results found for query")
             else:
@@ -85,61 +145,128 @@ class PaperScraper:
             raise
         return id_list
     
-    def fetch_pubmed_details(self, id_list: List[str]) -> List[Dict]:
+    def fetch_pubmed_details(self, id_list: List[str], batch_size: int = 200,
+                             history: Optional[SearchHistory] = None) -> List[Dict]:
         """
         Retrieve detailed metadata for a list of PubMed IDs.
+        Batches are posted to efetch concurrently. When the search history of the
+        page the IDs came from is given, batches are fetched from the history
+        server instead of re-submitting the IDs.
         """
         logger.info(f"Fetching details for {len(id_list)} papers...")
-        details = []
-        base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+        details = self._fetch_pubmed_batches(id_list, batch_size, history)
+        logger.info(f"Successfully fetched details for {len(details)} papers")
+        return details
+    
+    def _fetch_pubmed_batches(self, id_list: List[str], batch_size: int,
+                              history: Optional[SearchHistory] = None) -> List[Dict]:
+        """
+        Fetch and parse efetch batches on up to max_concurrency worker threads.
+        """
+        if not id_list:
+            return []
         
-        for pmid in id_list:
-            sleep(self.rate_limit)
-            params = {
-                "db": "pubmed",
-                "id": pmid,
-                "retmode": "xml",
-                "rettype": "full"
-            }
-            try:
-                response = requests.get(base_url, params=params)
-                response.raise_for_status()
-                soup = BeautifulSoup(response.text, "xml")
-                article_element = soup.find("PubmedArticle")
-                
-                if not article_element:
-                    logger.warning(f"No article data found for PMID {pmid}")
-                    continue
-                    
-                full_text_link = get_full_text_link(article_element, self.unpaywall_email)
-                
-                article = {
-                    "pubmed_id": pmid,
-                    "doi": get_doi(article_element),
-                    "title": get_title(article_element),
-                    "abstract": get_abstract(article_element),
-                    "authors": get_authors(article_element),
-                    "journal": get_journal_info(article_element),
-                    "publication_date": get_pub_date(article_element),
-                    "full_text_link": full_text_link
+        wanted = set(id_list)
+        
+        if history:
+            batches = [
+                {
+                    "WebEnv": history.webenv,
+                    "query_key": history.query_key,
+                    "retstart": history.retstart + start,
+                    "retmax": min(batch_size, history.retmax - start)
                 }
-                details.append(article)
-                logger.info(f"Successfully processed PMID {pmid}")
-            except Exception as e:
-                logger.error(f"Error processing PMID {pmid}: {e}")
-                continue
+                for start in range(0, history.retmax, batch_size)
+            ]
+        else:
+            batches = [
+                {"id": ",".join(id_list[start:start + batch_size])}
+                for start in range(0, len(id_list), batch_size)
+            ]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = executor.map(lambda data: self._fetch_pubmed_batch(data, wanted), batches)
+            details = [article for batch_details in results for article in batch_details]
         
-        logger.info(f"Successfully fetched details for {len(details)} papers")
+        if history:
+            # History sessions expire, fall back to posting any IDs that didn't come back
+            fetched = {article["pubmed_id"] for article in details}
+            missing = [pmid for pmid in id_list if pmid not in fetched]
+            if missing:
+                logger.warning(f"{len(missing)} papers missing from history server, fetching by ID")
+                details.extend(self._fetch_pubmed_batches(missing, batch_size))
+        
+        # Keep the search ranking, efetch does not guarantee the requested order
+        rank = {pmid: i for i, pmid in enumerate(id_list)}
+        details.sort(key=lambda article: rank.get(article["pubmed_id"], len(rank)))
         return details
     
+    def _fetch_pubmed_batch(self, batch: Dict, pmids: Set[str]) -> List[Dict]:
+        """
+        Post one efetch batch, selected by IDs or by history server offsets,
+        and parse the returned articles that are in pmids.
+        """
+        base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+        data = {
+            "db": "pubmed",
+            "retmode": "xml",
+            "rettype": "full",
+            **batch
+        }
+        try:
+            self.eutils_rate_limiter.wait()
+            response = self.eutils_session.post(base_url, data=data, timeout=60)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to fetch details batch from PubMed: {e}")
+            return []
+        return self._parse_pubmed_articles(response.content, pmids)
+    
+    def _parse_pubmed_articles(self, content: bytes, pmids: Optional[Set[str]] = None) -> List[Dict]:
+        """
+        Parse a PubmedArticleSet one PubmedArticle at a time, skipping articles
+        not in pmids when given.
+        Each article is cleared once parsed so memory stays bounded by a single article.
+        """
+        articles = []
+        try:
+            for _, article_element in etree.iterparse(BytesIO(content), tag="PubmedArticle"):
+                scanned = scan_article(article_element)
+                pmid = get_pmid(scanned)
+                try:
+                    if pmids is not None and pmid not in pmids:
+                        continue
+                    article = {
+                        "pubmed_id": pmid,
+                        "doi": get_doi(scanned),
+                        "title": get_title(scanned),
+                        "abstract": get_abstract(scanned),
+                        "authors": get_authors(scanned),
+                        "journal": get_journal_info(scanned),
+                        "publication_date": get_pub_date(scanned),
+                        "full_text_link": get_full_text_link(scanned, self.unpaywall_email,
+                                                             self.session)
+                    }
+                    articles.append(article)
+                    logger.info(f"Successfully processed PMID {pmid}")
+                except Exception as e:
+                    logger.error(f"Error processing PMID {pmid}: {e}")
+                finally:
+                    # Free the parsed article and any preceding siblings
+                    article_element.clear()
+                    while article_element.getprevious() is not None:
+                        del article_element.getparent()[0]
+        except etree.XMLSyntaxError as e:
+            logger.error(f"Failed to parse PubMed response: {e}")
+        return articles
+    
     def download_pdf(self, pdf_url: str, filename: str) -> str:
         """
         Download a PDF from a given URL and save it to the specified filename.
         """
-        return download_pdf(pdf_url, filename)
+        return download_pdf(pdf_url, filename, session=self.session)
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
-        Extract text from a PDF file using pdfplumber.
+        Extract text from a PDF file using PyMuPDF.
         """
-        return extract_text_from_pdf(pdf_path)
\ No newline at end of file
+        return extract_text_from_pdf(pdf_path)
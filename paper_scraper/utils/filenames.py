@@ -0,0 +1,25 @@
+from typing import Dict
+
+# Deletes every ASCII character that is neither alphanumeric nor whitespace
+_ASCII_DELETE_TABLE = str.maketrans('', '', ''.join(
+    c for c in map(chr, range(128)) if not (c.isalnum() or c.isspace())
+))
+
+def safe_title(title: str, max_length: int = 100) -> str:
+    """
+    Lowercase a title, keep only alphanumerics and whitespace and replace
+    spaces with underscores, truncated to max_length characters.
+    """
+    if title.isascii():
+        # Single C-level pass for the common case
+        kept = title.lower().translate(_ASCII_DELETE_TABLE)
+    else:
+        kept = ''.join(c.lower() for c in title if c.isalnum() or c.isspace())
+    return kept.replace(' ', '_')[:max_length]
+
+def pdf_filename(paper: Dict) -> str:
+    """
+    Build the PDF filename for a paper from its title.
+    Falls back to the PMID if title processing results in an empty string.
+    """
+    return f"{safe_title(paper.get('title', '')) or paper['pubmed_id']}.pdf"
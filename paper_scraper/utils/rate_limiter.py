@@ -0,0 +1,23 @@
+import threading
+import time
+
+class RateLimiter:
+    """
+    Thread-safe rate limiter that spaces calls at least `interval` seconds apart.
+    Shared between worker threads instead of each worker sleeping on its own.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self) -> None:
+        """
+        Block until the caller is allowed to make its next request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
@@ -33,6 +33,8 @@ def main():
                       help="Hugging Face model ID for the language model")
     parser.add_argument("--embedding-model", "-e", default="BAAI/bge-large-en-v1.5",
                       help="Embedding model to use for text vectorization")
+    parser.add_argument("--no-quantize", action="store_true",
+                      help="Load the language model unquantized (compiled with CUDA graphs on GPU)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
     
     args = parser.parse_args()
@@ -45,7 +47,8 @@ def main():
     logger.info("Initializing Research Assistant...")
     assistant = ResearchAssistant(
         model_name=args.model,
-        embedding_model_name=args.embedding_model
+        embedding_model_name=args.embedding_model,
+        quantize=not args.no_quantize
     )
     
     # Execute command
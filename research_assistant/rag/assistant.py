@@ -4,20 +4,33 @@ Research Assistant class implementing RAG for scientific literature QA.
 
 import logging
 import os
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Optional, Set, Tuple
 from pathlib import Path
-import json
 from datetime import datetime
 
+import numpy as np
+import orjson
+
 # Import components
 from paper_scraper.scraper import PaperScraper
+from paper_scraper.utils.filenames import pdf_filename
 from research_assistant.rag.embeddings.encoder import EmbeddingModel
-from research_assistant.rag.llm.model import LanguageModel
+from research_assistant.rag.llm.model import LanguageModel, MAX_INPUT_TOKENS
 from research_assistant.rag.indexing.vector_store import VectorIndex
 from research_assistant.rag.utils.text_processing import chunk_text, clean_text
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_WORKERS = 4  # Concurrent PDF downloads while building the corpus
+ENCODE_BATCH_SIZE = 64  # Chunks embedded per batch as papers finish processing
+
+PROMPT_HEADER = (
+    "Answer the following question based on these research paper excerpts.\n"
+    "Include citations to the papers when referencing specific information.\n\n"
+    "Research paper excerpts:"
+)
+
 class ResearchAssistant:
     """
     Research Assistant for scientific literature search and question answering.
@@ -30,7 +43,8 @@ class ResearchAssistant:
         self,
         model_name: str = "mistralai/Mistral-7B-Instruct-v0.1",
         embedding_model_name: str = "BAAI/bge-large-en-v1.5",
-        output_dir: str = "research_output"
+        output_dir: str = "research_output",
+        quantize: bool = True
     ):
         """
         Initialize the Research Assistant.
@@ -39,6 +53,8 @@ class ResearchAssistant:
             model_name: Hugging Face model ID for the language model
             embedding_model_name: Model for text embeddings
             output_dir: Directory to store output files
+            quantize: Whether to load the language model in 4-bit; unquantized
+                models are compiled with CUDA graphs on GPU for faster decoding
         """
         logger.info("Initializing Research Assistant components")
         
@@ -55,7 +71,11 @@ class ResearchAssistant:
         
         # Initialize language model
         logger.info("Loading language model")
-        self.language_model = LanguageModel(model_name=model_name)
+        self.language_model = LanguageModel(model_name=model_name, quantize=quantize)
+        
+        # The instructions open every prompt; tokenize them and cache their KV states once
+        self.prompt_prefix_ids = self.language_model.tokenize([PROMPT_HEADER], add_special_tokens=True)[0]
+        self.language_model.cache_prefix(self.prompt_prefix_ids)
         
         # Initialize vector index with embedding dimension
         embedding_dim = self.embedding_model.embedding_dim
@@ -66,7 +86,14 @@ class ResearchAssistant:
         self.paper_texts: List[str] = []
         self.paper_metadata: List[Dict] = []
         self.chunks: List[str] = []
-        self.chunk_metadata: List[Dict] = []
+        
+        # LM token ids of all chunks, concatenated; chunk i spans
+        # chunk_token_offsets[i]:chunk_token_offsets[i + 1]
+        self.chunk_token_ids: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.chunk_token_offsets: np.ndarray = np.zeros(1, dtype=np.int64)
+        
+        # Position in paper_metadata of each chunk's paper
+        self.chunk_paper_idx: np.ndarray = np.zeros(0, dtype=np.int32)
         
         logger.info("Research Assistant initialized successfully")
     
@@ -84,105 +111,158 @@ class ResearchAssistant:
         pmids = self.scraper.search_pubmed(query, max_results)
         
         # Get detailed information
-        papers = self.scraper.fetch_pubmed_details(pmids)
+        papers = self.scraper.fetch_pubmed_details(pmids, history=self.scraper.search_history)
         
-        # Reset existing storage
+        # Reset existing storage and cached query embeddings; the new corpus is
+        # only published once the whole pipeline has finished
         self.paper_texts = []
         self.paper_metadata = []
+        self.chunks = []
+        self.chunk_token_ids = np.zeros(0, dtype=np.int32)
+        self.chunk_token_offsets = np.zeros(1, dtype=np.int64)
+        self.chunk_paper_idx = np.zeros(0, dtype=np.int32)
+        self.vector_index = None
+        self.embedding_model.clear_cache()
+        
+        # Papers and chunks in completion order: (rank, paper, text, first chunk, end chunk)
+        processed: List[Tuple[int, Dict, str, int, int]] = []
+        streamed_chunks: List[str] = []
+        streamed_token_ids: List[np.ndarray] = []
+        embeddings: List[np.ndarray] = []
+        encoded = 0
         
-        # Process each paper
-        for paper in papers:
-            pdf_url = paper.get('full_text_link')
-            if not pdf_url:
-                logger.warning(f"No PDF available for paper {paper.get('pubmed_id')}")
-                continue
+        # Overlap the pipeline stages: each download thread extracts its PDF's
+        # text as soon as the download lands, and chunks are embedded in
+        # batches while the remaining papers are in flight
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_pool:
+            downloads: Dict[Future, Tuple[int, Dict]] = {}
+            for rank, paper in enumerate(papers):
+                pdf_url = paper.get('full_text_link')
+                if not pdf_url:
+                    logger.warning(f"No PDF available for paper {paper.get('pubmed_id')}")
+                    continue
                 
-            try:
                 # Create a safe filename from the title
+                pdf_path = self.output_dir / "papers" / "pdf" / pdf_filename(paper)
+                future = download_pool.submit(self._download_paper_text, pdf_url, str(pdf_path))
+                downloads[future] = (rank, paper)
+            
+            for future in as_completed(downloads):
+                rank, paper = downloads[future]
                 title = paper.get('title', '')
-                safe_title = ''.join(c.lower() for c in title if c.isalnum() or c.isspace())
-                safe_title = safe_title.replace(' ', '_')[:100]
-                
-                # Fall back to PMID if title processing results in empty string
-                filename = f"{safe_title or paper['pubmed_id']}.pdf"
-                pdf_path = self.output_dir / "papers" / "pdf" / filename
-                
-                # Download PDF
-                self.scraper.download_pdf(pdf_url, str(pdf_path))
-                
-                # Extract text from PDF
-                text = self.scraper.extract_text_from_pdf(str(pdf_path))
-                
-                # Clean text
-                text = clean_text(text)
+                try:
+                    # Clean text and split it into chunks, tokenized once here
+                    # for prompt assembly
+                    text = clean_text(future.result())
+                    paper_chunks = self._chunk_paper(text)
+                    token_ids = self.language_model.tokenize(paper_chunks) if paper_chunks else []
+                except Exception as e:
+                    logger.error(f"Error processing paper {paper.get('pubmed_id', 'unknown')}: {e}")
+                    continue
                 
                 # Store paper content and metadata
-                if text:
-                    self.paper_texts.append(text)
-                    self.paper_metadata.append(paper)
-                    logger.info(f"Successfully processed paper: {title}")
-                else:
+                if not text:
                     logger.warning(f"Failed to extract text from paper: {title}")
+                    continue
+                processed.append((rank, paper, text, len(streamed_chunks),
+                                  len(streamed_chunks) + len(paper_chunks)))
+                streamed_chunks.extend(paper_chunks)
+                streamed_token_ids.extend(np.array(ids, dtype=np.int32) for ids in token_ids)
+                logger.info(f"Successfully processed paper: {title}")
                 
-            except Exception as e:
-                logger.error(f"Error processing paper {paper.get('pubmed_id', 'unknown')}: {e}")
+                # Embed the new chunks once a full batch is ready
+                if len(streamed_chunks) - encoded >= ENCODE_BATCH_SIZE:
+                    embeddings.append(self._encode_chunks(streamed_chunks[encoded:]))
+                    encoded = len(streamed_chunks)
+        
+        if len(streamed_chunks) > encoded:
+            embeddings.append(self._encode_chunks(streamed_chunks[encoded:]))
+        
+        # Papers finish in completion order; restore the search ranking
+        processed.sort(key=lambda record: record[0])
+        order = [i for _, _, _, first, end in processed for i in range(first, end)]
+        self.paper_texts = [text for _, _, text, _, _ in processed]
+        self.paper_metadata = [paper for _, paper, _, _, _ in processed]
+        self.chunks = [streamed_chunks[i] for i in order]
+        if order:
+            self.chunk_token_ids = np.concatenate([streamed_token_ids[i] for i in order])
+            self.chunk_token_offsets = np.cumsum(
+                [0] + [len(streamed_token_ids[i]) for i in order], dtype=np.int64
+            )
+        self.chunk_paper_idx = np.repeat(
+            np.arange(len(processed), dtype=np.int32),
+            [end - first for _, _, _, first, end in processed]
+        )
+        vectors = np.vstack(embeddings)[order] if embeddings else None
         
         logger.info(f"Successfully processed {len(self.paper_texts)} papers")
+        logger.info(f"Created {len(self.chunks)} chunks from {len(self.paper_texts)} papers")
         
-        # Create search index from papers
-        self._build_index()
+        # Create search index from the streamed embeddings
+        self._build_index(vectors)
         
         # Save metadata of successfully processed papers
         self._save_paper_metadata()
     
-    def _build_index(self) -> None:
+    def _download_paper_text(self, pdf_url: str, pdf_path: str) -> str:
         """
-        Process papers into chunks and build search index.
+        Download one paper's PDF and extract its raw text, on a download thread.
         """
-        logger.info("Building search index from papers")
+        self.scraper.download_pdf(pdf_url, pdf_path)
+        return self.scraper.extract_text_from_pdf(pdf_path)
+    
+    def _chunk_paper(self, text: str) -> List[str]:
+        """
+        Split a paper's text into chunks suitable for indexing.
         
-        # Reset chunks
-        self.chunks = []
-        self.chunk_metadata = []
-        
-        # Process each paper into chunks
-        for text, metadata in zip(self.paper_texts, self.paper_metadata):
-            # Split text into chunks
-            paper_chunks = chunk_text(
-                text, 
-                chunk_size=500,  # Words per chunk
-                chunk_overlap=50  # Words of overlap
-            )
+        Args:
+            text: Cleaned paper text
             
-            # Add each chunk with its metadata
-            for chunk in paper_chunks:
-                if len(chunk.split()) >= 30:  # Only keep substantive chunks
-                    self.chunks.append(chunk)
-                    self.chunk_metadata.append(metadata)
+        Returns:
+            List of text chunks
+        """
+        paper_chunks = chunk_text(
+            text, 
+            chunk_size=500,  # Words per chunk
+            chunk_overlap=50  # Words of overlap
+        )
         
-        logger.info(f"Created {len(self.chunks)} chunks from {len(self.paper_texts)} papers")
+        # Only keep substantive chunks
+        return [chunk for chunk in paper_chunks if len(chunk.split()) >= 30]
+    
+    def _encode_chunks(self, chunks: List[str]) -> np.ndarray:
+        """
+        Embed one batch of chunks as they stream out of the pipeline.
+        """
+        return self.embedding_model.encode(
+            chunks,
+            batch_size=ENCODE_BATCH_SIZE,
+            show_progress=False
+        )
+    
+    def _build_index(self, vectors: Optional[np.ndarray]) -> None:
+        """
+        Build the search index from the chunk embeddings.
         
-        # Generate embeddings for all chunks
-        if self.chunks:
-            embeddings = self.embedding_model.encode(
-                self.chunks,
-                batch_size=8,
-                show_progress=True
-            )
-            
-            # Initialize vector index with proper dimension
-            embedding_dim = embeddings.shape[1]
-            self.vector_index = VectorIndex(dimension=embedding_dim)
-            
-            # Add embeddings to index
-            self.vector_index.add_vectors(embeddings)
-            logger.info(f"Added {len(embeddings)} vectors to search index")
-        else:
+        Args:
+            vectors: Chunk embeddings, in the same order as self.chunks
+        """
+        logger.info("Building search index from papers")
+        
+        if vectors is None or not len(vectors):
+            self.vector_index = None
             logger.warning("No chunks to index")
+            return
+        
+        # All vectors are added at once so the index type is chosen from the
+        # final collection size
+        self.vector_index = VectorIndex(dimension=vectors.shape[1])
+        self.vector_index.add_vectors(vectors)
+        logger.info(f"Added {len(vectors)} vectors to search index")
     
     def _save_paper_metadata(self) -> None:
         """
-        Save metadata of processed papers.
+        Save metadata of processed papers as newline-delimited JSON.
         """
         if not self.paper_metadata:
             return
@@ -191,10 +271,14 @@ class ResearchAssistant:
         metadata_path = self.output_dir / "papers" / "metadata"
         metadata_path.mkdir(parents=True, exist_ok=True)
         
-        metadata_file = metadata_path / f"papers_{timestamp}.json"
+        metadata_file = metadata_path / f"papers_{timestamp}.jsonl"
         
-        with open(metadata_file, "w") as f:
-            json.dump(self.paper_metadata, f, indent=2)
+        # One compact record per line, streamed through the buffered file
+        with open(metadata_file, "wb") as f:
+            f.writelines(
+                orjson.dumps(metadata, option=orjson.OPT_APPEND_NEWLINE)
+                for metadata in self.paper_metadata
+            )
             
         logger.info(f"Saved metadata to {metadata_file}")
     
@@ -204,7 +288,7 @@ class ResearchAssistant:
         
         Args:
             question: User's question about the papers
-            k: Number of most relevant chunks to use
+            k: Number of most relevant chunks to use (at most one per paper)
             
         Returns:
             Generated answer with citations
@@ -218,49 +302,41 @@ class ResearchAssistant:
         # Generate embedding for the question
         question_embedding = self.embedding_model.encode(question)
         
-        # Find most similar chunks
-        distances, indices = self.vector_index.search(
-            question_embedding.reshape(1, -1), k=k
-        )
+        # Find most similar chunks, over-fetching so that k distinct papers
+        # remain after keeping only the best chunk of each paper
+        search_k = min(k * 3, len(self.chunks))
+        distances, indices = self.vector_index.search(question_embedding, k=search_k)
         
-        # Build context from relevant chunks
-        context = ""
-        used_papers = set()
+        # Assemble the prompt in token space from the pre-tokenized chunks,
+        # reserving room for the instructions and the question
+        prompt_ids = list(self.prompt_prefix_ids)
+        question_ids = self.language_model.tokenize([f"\n\nQuestion: {question}\n\nAnswer: "])[0]
+        max_tokens = MAX_INPUT_TOKENS - len(prompt_ids) - len(question_ids)
         total_tokens = 0
-        max_tokens = 2048  # Limit total context length
         
-        for idx in indices[0]:
-            chunk = self.chunks[idx]
-            metadata = self.chunk_metadata[idx]
-            paper_id = metadata['pubmed_id']
+        # Only include the best-ranked chunk of each paper, keeping rank order
+        hits = indices[0][indices[0] >= 0]  # FAISS pads missing results with -1
+        _, first_seen = np.unique(self.chunk_paper_idx[hits], return_index=True)
+        
+        for idx in hits[np.sort(first_seen)][:k]:
+            # Add paper citation and chunk to context if it fits the token budget
+            metadata = self.paper_metadata[self.chunk_paper_idx[idx]]
+            paper_citation = f"'{metadata['title']}' ({metadata.get('journal', {}).get('name', 'Journal')})"
+            citation_ids = self.language_model.tokenize([f"\n\nFrom paper {paper_citation}:\n"])[0]
+            chunk_ids = self.chunk_token_ids[self.chunk_token_offsets[idx]:self.chunk_token_offsets[idx + 1]]
+            chunk_tokens = len(citation_ids) + len(chunk_ids)
+            if total_tokens + chunk_tokens > max_tokens:
+                break
             
-            # Only include first chunk from each paper and check token length
-            if paper_id not in used_papers:
-                # Estimate token count (rough approximation)
-                chunk_tokens = len(chunk.split()) * 1.3
-                if total_tokens + chunk_tokens > max_tokens:
-                    break
-                    
-                # Add paper citation and chunk to context
-                used_papers.add(paper_id)
-                paper_citation = f"'{metadata['title']}' ({metadata.get('journal', {}).get('name', 'Journal')})"
-                context += f"\n\nFrom paper {paper_citation}:\n{chunk}\n"
-                total_tokens += chunk_tokens
-        
-        # Construct prompt for the language model
-        prompt = f"""Answer the following question based on these research paper excerpts. 
-        Include citations to the papers when referencing specific information.
-
-        Research paper excerpts:
-        {context}
-
-        Question: {question}
-
-        Answer: """
+            prompt_ids += citation_ids
+            prompt_ids += chunk_ids.tolist()
+            total_tokens += chunk_tokens
+        
+        prompt_ids += question_ids
         
         # Generate answer using language model
         answer = self.language_model.generate(
-            prompt=prompt,
+            prompt=prompt_ids,
             max_new_tokens=512,
             temperature=0.7,
             top_p=0.9,
@@ -3,6 +3,7 @@ Text embedding functionality using sentence-transformers.
 """
 
 import logging
+from functools import lru_cache
 import torch
 from typing import List, Union, Optional
 import numpy as np
@@ -18,12 +19,19 @@ class EmbeddingModel:
     which is essential for semantic search in RAG systems.
     """
     
-    def __init__(self, model_name: str = "BAAI/bge-large-en-v1.5"):
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-large-en-v1.5",
+        cache_size: int = 512,
+        fp16: bool = True
+    ):
         """
         Initialize the embedding model.
         
         Args:
             model_name: Hugging Face model ID or path for the embedding model
+            cache_size: Number of single-text (query) embeddings to keep cached
+            fp16: Whether to run the model in half precision on GPU
         """
         logger.info(f"Loading embedding model: {model_name}")
         
@@ -35,6 +43,10 @@ class EmbeddingModel:
                 logger.info("Moving embedding model to GPU")
                 self.model.to('cuda')
                 self.device = 'cuda'
+                
+                if fp16:
+                    logger.info("Using half precision for embedding model")
+                    self.model.half()
             else:
                 logger.info("GPU not available, using CPU")
                 self.device = 'cpu'
@@ -42,13 +54,16 @@ class EmbeddingModel:
             self.embedding_dim = self.model.get_sentence_embedding_dimension()
             logger.info(f"Embedding dimension: {self.embedding_dim}")
             
+            # Per-instance cache so repeated questions skip the transformer
+            self._encode_cached = lru_cache(maxsize=cache_size)(self._encode_single)
+            
         except Exception as e:
             logger.error(f"Failed to load embedding model: {e}")
             raise
     
     def encode(self, 
                texts: Union[str, List[str]], 
-               batch_size: int = 8, 
+               batch_size: Optional[int] = None, 
                show_progress: bool = True,
                normalize: bool = True) -> np.ndarray:
         """
@@ -57,24 +72,53 @@ class EmbeddingModel:
         Args:
             texts: Single text or list of texts to encode
             batch_size: Number of texts to process at once
+                (default: 64 on GPU, 32 on CPU)
             show_progress: Whether to show a progress bar
             normalize: Whether to normalize the embeddings
             
         Returns:
-            NumPy array of embeddings
+            NumPy array of embeddings. A single text is returned as a cached,
+            read-only float32 array of shape (1, dimension).
         """
         if isinstance(texts, str):
-            texts = [texts]
+            return self._encode_cached(texts, normalize)
             
+        batch_size = batch_size or (64 if self.device == 'cuda' else 32)
         logger.debug(f"Encoding {len(texts)} texts with batch size {batch_size}")
         
-        # Generate embeddings
+        # Generate embeddings; sentence-transformers sorts texts by length
+        # internally so each batch is only padded to its longest member
         embeddings = self.model.encode(
             texts,
             batch_size=batch_size,
+            device=self.device,
             show_progress_bar=show_progress,
             convert_to_numpy=True,
             normalize_embeddings=normalize
         )
         
-        return embeddings
\ No newline at end of file
+        # FAISS requires float32, half precision models return float16
+        return embeddings.astype(np.float32, copy=False)
+    
+    def _encode_single(self, text: str, normalize: bool) -> np.ndarray:
+        """
+        Encode one text into a contiguous float32 array ready for index search.
+        """
+        embedding = self.model.encode(
+            [text],
+            batch_size=1,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=normalize
+        )
+        embedding = np.ascontiguousarray(embedding, dtype=np.float32).reshape(1, -1)
+        
+        # Cached arrays are shared between callers, guard against in-place edits
+        embedding.setflags(write=False)
+        return embedding
+    
+    def clear_cache(self) -> None:
+        """
+        Drop all cached single-text embeddings.
+        """
+        self._encode_cached.cache_clear()
\ No newline at end of file
@@ -3,6 +3,7 @@ FAISS-based vector indexing for similarity search.
 """
 
 import logging
+import math
 import faiss
 import numpy as np
 from typing import List, Tuple, Dict, Any, Optional
@@ -17,38 +18,83 @@ class VectorIndex:
     enabling fast semantic retrieval for RAG systems.
     """
     
-    def __init__(self, dimension: int):
+    def __init__(
+        self,
+        dimension: int,
+        nlist: Optional[int] = None,
+        m: int = 32,
+        nbits: int = 8,
+        nprobe: int = 16,
+        ivf_threshold: int = 10_000
+    ):
         """
         Initialize the vector index.
         
         Args:
             dimension: Dimensionality of the embedding vectors
+            nlist: Number of IVF cells (default: about 4 * sqrt(N) at first add)
+            m: Number of PQ sub-quantizers, must divide the dimension
+            nbits: Bits per PQ sub-quantizer code
+            nprobe: Number of IVF cells visited per query
+            ivf_threshold: Minimum number of vectors for an IVF-PQ index;
+                smaller collections use exact flat search
         """
         logger.info(f"Initializing vector index with dimension {dimension}")
         
-        # Create a flat L2 index (exact search)
+        self.dimension = dimension
+        self.nlist = nlist
+        self.m = m
+        self.nbits = nbits
+        self.nprobe = nprobe
+        self.ivf_threshold = ivf_threshold
+        
+        # Start with a flat inner-product index (exact cosine search on normalized vectors)
         try:
             if faiss.get_num_gpus() > 0:
                 # Use GPU if available
                 logger.info("Using GPU for vector indexing")
-                res = faiss.StandardGpuResources()
-                self.index = faiss.GpuIndexFlatL2(res, dimension)
+                self.gpu_resources = faiss.StandardGpuResources()
+                self.index = faiss.GpuIndexFlatIP(self.gpu_resources, dimension)
             else:
                 # Fall back to CPU
                 logger.info("Using CPU for vector indexing")
-                self.index = faiss.IndexFlatL2(dimension)
-                
-            self.dimension = dimension
-            self.vectors = []  # Store vectors for potential reuse
+                self.gpu_resources = None
+                self.index = faiss.IndexFlatIP(dimension)
             
         except Exception as e:
             logger.error(f"Failed to initialize FAISS index: {e}")
             raise
     
+    def _create_ivfpq_index(self, n_vectors: int) -> faiss.Index:
+        """
+        Create an untrained IVF-PQ index sized for n_vectors.
+        
+        Embeddings are normalized, so inner product ranks like cosine similarity.
+        """
+        # ~4 * sqrt(N) cells, keeping at least 39 training points per cell
+        nlist = self.nlist or max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+        logger.info(f"Creating IVF-PQ index with {nlist} cells and {self.m}x{self.nbits}-bit codes")
+        
+        index = faiss.index_factory(
+            self.dimension, f"IVF{nlist},PQ{self.m}x{self.nbits}", faiss.METRIC_INNER_PRODUCT
+        )
+        index.nprobe = self.nprobe
+        
+        if self.gpu_resources is not None:
+            try:
+                index = faiss.index_cpu_to_gpu(self.gpu_resources, 0, index)
+            except Exception as e:
+                logger.warning(f"IVF-PQ index not supported on GPU, using CPU: {e}")
+        return index
+    
     def add_vectors(self, vectors: np.ndarray) -> None:
         """
         Add vectors to the index.
         
+        The first add of at least ivf_threshold vectors switches the index to
+        IVF-PQ and trains it on those vectors. Vectors that are not unit length
+        are L2-normalized (on a copy) so inner product equals cosine similarity.
+        
         Args:
             vectors: NumPy array of vectors to add (shape: [n, dimension])
         """
@@ -58,13 +104,57 @@ class VectorIndex:
         logger.info(f"Adding {vectors.shape[0]} vectors to index")
         
         try:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            if not np.allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-3):
+                logger.warning("Vectors are not L2-normalized, normalizing before indexing")
+                vectors = vectors.copy()
+                faiss.normalize_L2(vectors)
+            
+            if self.index.ntotal == 0 and vectors.shape[0] >= self.ivf_threshold:
+                if self.dimension % self.m == 0:
+                    self.index = self._create_ivfpq_index(vectors.shape[0])
+                else:
+                    logger.warning(f"Dimension {self.dimension} not divisible by m={self.m}, keeping flat index")
+            
+            if not self.index.is_trained:
+                logger.info("Training index")
+                self.index.train(vectors)
+            
             self.index.add(vectors)
-            self.vectors.append(vectors)  # Store for potential reuse
             
         except Exception as e:
             logger.error(f"Failed to add vectors to index: {e}")
             raise
     
+    def get_vectors(self, start: int = 0, n: Optional[int] = None) -> np.ndarray:
+        """
+        Reconstruct stored vectors from the index.
+        
+        Vectors held by an IVF-PQ index are decoded from their PQ codes, so they
+        only approximate the (normalized) vectors that were added.
+        
+        Args:
+            start: Position of the first vector to return
+            n: Number of vectors to return (default: all from start onwards)
+            
+        Returns:
+            NumPy array of vectors (shape: [n, dimension])
+        """
+        if n is None:
+            n = self.index.ntotal - start
+        
+        try:
+            # IVF indexes need an id -> list map before they can reconstruct
+            ivf_index = faiss.try_extract_index_ivf(self.index)
+            if ivf_index is not None and ivf_index.direct_map.type == faiss.DirectMap.NoMap:
+                ivf_index.make_direct_map()
+            
+            return self.index.reconstruct_n(start, n)
+            
+        except Exception as e:
+            logger.error(f"Failed to reconstruct vectors from index: {e}")
+            raise
+    
     def search(self, query_vector: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
         """
         Search for similar vectors in the index.
@@ -82,8 +172,9 @@ class VectorIndex:
         logger.debug(f"Searching for {k} neighbors")
         
         try:
-            # Ensure proper shape for search
-            query_vector = query_vector.astype(np.float32)
+            # FAISS needs contiguous float32; only copy when the query isn't already
+            if query_vector.dtype != np.float32 or not query_vector.flags['C_CONTIGUOUS']:
+                query_vector = np.ascontiguousarray(query_vector, dtype=np.float32)
             
             # Perform search
             distances, indices = self.index.search(query_vector, k)
@@ -107,16 +198,29 @@ class VectorIndex:
             logger.error(f"Failed to save index: {e}")
             raise
     
-    def load(self, filepath: str) -> None:
+    def load(self, filepath: str, mmap: bool = True) -> None:
         """
         Load the index from disk.
         
+        With mmap, the inverted lists of IVF indexes are memory-mapped and paged
+        in on demand instead of being read into RAM up front. Such an index is
+        read-only; load with mmap=False to add vectors afterwards. Flat indexes
+        are always read into memory.
+        
         Args:
             filepath: Path to load the index from
+            mmap: Whether to memory-map the index file
         """
         logger.info(f"Loading index from {filepath}")
         try:
-            self.index = faiss.read_index(filepath)
+            if mmap:
+                try:
+                    self.index = faiss.read_index(filepath, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                except RuntimeError as e:
+                    logger.warning(f"Failed to memory-map index, reading it into memory: {e}")
+                    self.index = faiss.read_index(filepath)
+            else:
+                self.index = faiss.read_index(filepath)
             self.dimension = self.index.d
         except Exception as e:
             logger.error(f"Failed to load index: {e}")
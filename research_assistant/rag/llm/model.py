@@ -2,18 +2,75 @@
 Language model initialization and text generation functionality.
 """
 
+import copy
+import importlib.util
 import logging
 import torch
-from typing import Optional, Dict, Any, Union, List
+from typing import Optional, Dict, Any, Union, List, Literal
 from transformers import (
     AutoTokenizer, 
     AutoModelForCausalLM, 
     BitsAndBytesConfig,
+    DynamicCache,
     GenerationConfig
 )
 
 logger = logging.getLogger(__name__)
 
+MAX_INPUT_TOKENS = 2048  # Hard limit on prompt length
+
+def _select_attn_implementation(torch_dtype: torch.dtype) -> str:
+    """
+    Pick the fused attention kernel for the current environment.
+    
+    Flash-Attention-2 needs the flash_attn package, an Ampere or newer GPU and
+    half-precision weights; otherwise PyTorch's built-in SDPA kernel is used.
+    """
+    if (
+        importlib.util.find_spec("flash_attn") is not None
+        and torch.cuda.is_available()
+        and torch.cuda.get_device_capability()[0] >= 8
+        and torch_dtype in (torch.float16, torch.bfloat16)
+    ):
+        return "flash_attention_2"
+    return "sdpa"
+
+# Pre-quantized checkpoints whose int4 kernels run matmuls without dequantizing
+PREQUANTIZED_MODELS: Dict[str, Dict[str, str]] = {
+    "mistralai/Mistral-7B-Instruct-v0.1": {
+        "awq": "TheBloke/Mistral-7B-Instruct-v0.1-AWQ",
+        "gptq": "TheBloke/Mistral-7B-Instruct-v0.1-GPTQ",
+    },
+}
+
+# Packages transformers needs to load each pre-quantized format
+_QUANTIZATION_BACKENDS = {
+    "awq": ("awq",),
+    "gptq": ("optimum", "auto_gptq"),
+}
+
+def _find_prequantized_model(model_name: str, quantization: str) -> Optional[str]:
+    """
+    Return the pre-quantized checkpoint to load for model_name, or None to
+    quantize the original weights with bitsandbytes nf4 instead.
+    """
+    if quantization == "nf4":
+        return None
+    if quantization not in _QUANTIZATION_BACKENDS:
+        raise ValueError(f"Unsupported quantization: {quantization}")
+    
+    prequantized_name = PREQUANTIZED_MODELS.get(model_name, {}).get(quantization)
+    if prequantized_name is None:
+        logger.warning(f"No {quantization.upper()} weights known for {model_name}, using nf4 quantization")
+        return None
+    
+    missing = [package for package in _QUANTIZATION_BACKENDS[quantization]
+               if importlib.util.find_spec(package) is None]
+    if missing:
+        logger.warning(f"{quantization.upper()} support requires {', '.join(missing)}, using nf4 quantization")
+        return None
+    return prequantized_name
+
 class LanguageModel:
     """
     Wrapper for Hugging Face language models for text generation.
@@ -26,8 +83,10 @@ class LanguageModel:
         self, 
         model_name: str = "mistralai/Mistral-7B-Instruct-v0.1",
         quantize: bool = True,
+        quantization: Literal["nf4", "awq", "gptq"] = "awq",
         device_map: str = "auto",
-        torch_dtype: torch.dtype = torch.float16
+        torch_dtype: torch.dtype = torch.float16,
+        compile_model: bool = True
     ):
         """
         Initialize the language model and tokenizer.
@@ -35,8 +94,13 @@ class LanguageModel:
         Args:
             model_name: Hugging Face model ID or path
             quantize: Whether to apply 4-bit quantization
+            quantization: 4-bit scheme; "awq" and "gptq" load pre-quantized
+                weights and fall back to bitsandbytes "nf4" when unavailable
             device_map: Device mapping strategy ("auto" or specific devices)
             torch_dtype: Data type for model weights
+            compile_model: Whether to compile the forward pass with CUDA graphs.
+                Only applies to unquantized models (quantize=False) on a CUDA
+                device with PyTorch >= 2.1; ignored otherwise
         """
         logger.info(f"Loading language model: {model_name}")
         
@@ -44,24 +108,56 @@ class LanguageModel:
             # Initialize tokenizer
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
             
-            # Configure quantization if enabled
-            quantization_config = None
-            if quantize:
-                logger.info("Using 4-bit quantization for reduced memory usage")
-                quantization_config = BitsAndBytesConfig(
-                    load_in_4bit=True,
-                    bnb_4bit_quant_type="nf4",
-                    bnb_4bit_compute_dtype=torch_dtype,
-                    bnb_4bit_use_double_quant=True
+            attn_implementation = _select_attn_implementation(torch_dtype)
+            logger.info(f"Using {attn_implementation} attention")
+            
+            # Prefer pre-quantized weights, which carry their own quantization config
+            self.model = None
+            prequantized_name = _find_prequantized_model(model_name, quantization) if quantize else None
+            if prequantized_name:
+                logger.info(f"Using pre-quantized {quantization.upper()} weights from {prequantized_name}")
+                try:
+                    self.model = AutoModelForCausalLM.from_pretrained(
+                        prequantized_name,
+                        torch_dtype=torch_dtype,
+                        device_map=device_map,
+                        attn_implementation=attn_implementation,
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to load {prequantized_name}, using nf4 quantization: {e}")
+            
+            if self.model is None:
+                # Configure quantization if enabled
+                quantization_config = None
+                if quantize:
+                    logger.info("Using 4-bit quantization for reduced memory usage")
+                    quantization_config = BitsAndBytesConfig(
+                        load_in_4bit=True,
+                        bnb_4bit_quant_type="nf4",
+                        bnb_4bit_compute_dtype=torch_dtype,
+                        bnb_4bit_use_double_quant=True
+                    )
+                
+                # Load model with configuration and a fused attention kernel
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    model_name,
+                    quantization_config=quantization_config,
+                    torch_dtype=torch_dtype,
+                    device_map=device_map,
+                    attn_implementation=attn_implementation,
                 )
             
-            # Load model with configuration
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                quantization_config=quantization_config,
-                torch_dtype=torch_dtype,
-                device_map=device_map,
-            )
+            # Static KV cache shapes let torch.compile capture the decoding step
+            # as a CUDA graph, removing per-token kernel launch overhead
+            self.cache_implementation = None
+            if compile_model and not quantize and torch.cuda.is_available() and torch.__version__ >= "2.1":
+                logger.info("Compiling language model forward pass")
+                self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=False)
+                self.cache_implementation = "static"
+            
+            # KV cache of a fixed prompt prefix, set by cache_prefix()
+            self.prefix_ids: List[int] = []
+            self.prefix_cache = None
             
             logger.info("Language model loaded successfully")
             
@@ -69,9 +165,42 @@ class LanguageModel:
             logger.error(f"Failed to load language model: {e}")
             raise
     
+    def tokenize(self, texts: List[str], add_special_tokens: bool = False) -> List[List[int]]:
+        """
+        Convert texts to token ids with the model's tokenizer.
+        
+        Args:
+            texts: Texts to tokenize
+            add_special_tokens: Whether to add special tokens such as BOS
+            
+        Returns:
+            List of token id lists, one per text
+        """
+        return self.tokenizer(texts, add_special_tokens=add_special_tokens)["input_ids"]
+    
+    def cache_prefix(self, prefix_ids: List[int]) -> None:
+        """
+        Precompute the KV cache of a prompt prefix shared by later generate calls.
+        
+        Token id prompts that start with this prefix then only run the model over
+        the remaining tokens. Not used with the compiled static cache.
+        
+        Args:
+            prefix_ids: Token ids of the fixed prompt prefix
+        """
+        if self.cache_implementation or not prefix_ids:
+            return
+        
+        logger.info(f"Caching KV states for a {len(prefix_ids)}-token prompt prefix")
+        input_ids = torch.tensor([prefix_ids], device=self.model.device)
+        with torch.no_grad():
+            outputs = self.model(input_ids=input_ids, past_key_values=DynamicCache(), use_cache=True)
+        self.prefix_ids = list(prefix_ids)
+        self.prefix_cache = outputs.past_key_values
+    
     def generate(
         self, 
-        prompt: str,
+        prompt: Union[str, List[int]],
         max_new_tokens: int = 512,
         temperature: float = 0.7,
         top_p: float = 0.9,
@@ -83,7 +212,8 @@ class LanguageModel:
         Generate text based on the provided prompt.
         
         Args:
-            prompt: Input text prompt
+            prompt: Input text prompt, or its token ids (used as is, without
+                adding special tokens)
             max_new_tokens: Maximum number of tokens to generate
             temperature: Sampling temperature (higher = more random)
             top_p: Nucleus sampling parameter
@@ -94,15 +224,34 @@ class LanguageModel:
         Returns:
             Generated text (without the prompt)
         """
-        # Tokenize input
-        inputs = self.tokenizer(
-            prompt, 
-            return_tensors="pt",
-            truncation=True,
-            max_length=2048  # Hard limit on input length
-        ).to(self.model.device)
+        # Tokenize input unless the caller already assembled the token ids
+        if isinstance(prompt, str):
+            inputs = self.tokenizer(
+                prompt, 
+                return_tensors="pt",
+                truncation=True,
+                max_length=MAX_INPUT_TOKENS
+            ).to(self.model.device)
+        else:
+            prompt = prompt[:MAX_INPUT_TOKENS]
+            input_ids = torch.tensor([prompt], device=self.model.device)
+            inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+            
+            # Start from the cached prefix states (copied, as generate extends them)
+            prefix_length = len(self.prefix_ids)
+            if (
+                self.prefix_cache is not None
+                and num_return_sequences == 1
+                and kwargs.get("num_beams", 1) == 1
+                and len(prompt) > prefix_length
+                and prompt[:prefix_length] == self.prefix_ids
+            ):
+                inputs["past_key_values"] = copy.deepcopy(self.prefix_cache)
+        input_length = inputs["input_ids"].shape[1]
         
         # Set up generation config
+        if self.cache_implementation:
+            kwargs.setdefault("cache_implementation", self.cache_implementation)
         generation_config = GenerationConfig(
             max_new_tokens=max_new_tokens,
             temperature=temperature,
@@ -110,6 +259,7 @@ class LanguageModel:
             do_sample=do_sample,
             num_return_sequences=num_return_sequences,
             pad_token_id=self.tokenizer.eos_token_id,
+            use_cache=True,
             **kwargs
         )
         
@@ -120,10 +270,6 @@ class LanguageModel:
                 generation_config=generation_config
             )
         
-        # Decode and return
-        generated_text = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extract the newly generated part (without the prompt)
-        if generated_text.startswith(prompt):
-            return generated_text[len(prompt):].strip()
+        # Decode only the newly generated tokens (without the prompt)
+        generated_text = self.tokenizer.decode(outputs[0][input_length:], skip_special_tokens=True)
         return generated_text.strip()
\ No newline at end of file
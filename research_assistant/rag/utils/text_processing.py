@@ -3,11 +3,54 @@ Text processing utilities for chunking and preparing text for RAG systems.
 """
 
 import logging
-from typing import List, Tuple, Dict, Any, Optional
+from typing import List, Tuple, Dict, Any, Iterator, Optional
 import re
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+# Lookup table of whitespace code points (as matched by str.split() and \s);
+# everything above U+3000 maps to the final, non-whitespace entry
+_SPACE_TABLE = np.array([chr(c).isspace() for c in range(0x3002)], dtype=bool)
+_PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+
+def _paragraph_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    Yield (start, end) offsets of the paragraphs in text, separated by blank lines.
+    """
+    start = 0
+    for match in _PARAGRAPH_BREAK_RE.finditer(text):
+        yield start, match.start()
+        start = match.end()
+    yield start, len(text)
+
+def _word_offsets(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the start and end offsets of every whitespace-separated word in text.
+    """
+    codes = np.frombuffer(text.encode('utf-32-le', 'surrogatepass'), dtype=np.uint32)
+    is_word = ~_SPACE_TABLE[np.minimum(codes, _SPACE_TABLE.size - 1)]
+    edges = np.diff(is_word.view(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+# Single-pass cleanup; the replacement is picked by which group matched:
+# 1. page numbers on their own line (common in PDFs) together with all of the
+#    whitespace around them, tried first so the whitespace branch can't take
+#    the surrounding newlines; every whitespace run thus becomes a single space
+# 2. whitespace runs other than a lone space
+# 3. curly double quotes, 4. curly single quotes
+_CLEAN_RE = re.compile(
+    r'(\s*\n\s*\d+\s*\n\s*)'
+    r'|(\s{2,}|[^\S ])'
+    r'|([\u201c\u201d\u201e\u201f])'
+    r'|([\u2018\u2019\u201a\u201b])'
+)
+_CLEAN_REPLACEMENTS = (None, ' ', ' ', '"', "'")
+
+def _clean_replacement(match: re.Match) -> str:
+    return _CLEAN_REPLACEMENTS[match.lastindex]
+
 def chunk_text(
     text: str, 
     chunk_size: int = 500, 
@@ -29,27 +72,34 @@ def chunk_text(
     if not text or not text.strip():
         return []
     
-    # Split text into paragraphs
-    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
-    
     # Prepare to process paragraphs into chunks
     chunks = []
     current_chunk = []
     current_size = 0
     
-    for para in paragraphs:
-        # Split paragraph into words and get word count
-        words = para.split()
-        para_size = len(words)
+    # Word boundaries are found once for the whole text; each paragraph is
+    # then just a range of word indices
+    word_starts, word_ends = _word_offsets(text)
+    para_offsets = np.array(list(_paragraph_spans(text)), dtype=np.int64)
+    para_words = np.searchsorted(word_starts, para_offsets).tolist()
+    word_starts = word_starts.tolist()
+    word_ends = word_ends.tolist()
+    
+    for first, last in para_words:
+        para_size = last - first
+        if not para_size:
+            continue
         
         # If a single paragraph exceeds chunk size, split it further
         if para_size > chunk_size * 1.5:
-            # Process large paragraph separately
-            for i in range(0, para_size, chunk_size - chunk_overlap):
-                para_chunk = ' '.join(words[i:i + chunk_size])
-                if len(para_chunk.split()) >= min_chunk_length:
-                    chunks.append(para_chunk)
+            # Process large paragraph separately, slicing the original text
+            for i in range(first, last, chunk_size - chunk_overlap):
+                end = min(i + chunk_size, last)
+                if end - i >= min_chunk_length:
+                    chunks.append(text[word_starts[i]:word_ends[end - 1]])
         else:
+            para = text[word_starts[first]:word_ends[last - 1]]
+            
             # For normal paragraphs, try to combine them up to chunk_size
             if current_size + para_size <= chunk_size:
                 # Add to current chunk
@@ -81,14 +131,4 @@ def clean_text(text: str) -> str:
     Returns:
         Cleaned text
     """
-    # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    
-    # Normalize quotes
-    text = re.sub(r'["""]', '"', text)
-    text = re.sub(r"[''']", "'", text)
-    
-    # Remove page numbers and headers/footers (common in PDFs)
-    text = re.sub(r'\n\s*\d+\s*\n', '\n', text)
-    
-    return text
\ No newline at end of file
+    return _CLEAN_RE.sub(_clean_replacement, text).strip()
\ No newline at end of file